@@ -1,8 +1,9 @@
 import dis
-import re
 import sys
+from collections import OrderedDict
+from functools import lru_cache
 from inspect import signature
-from itertools import chain, tee
+from itertools import tee
 from types import CodeType, FunctionType
 from typing import Any, Dict, Iterable, List, Tuple
 
@@ -23,6 +24,19 @@ class OpCode:
     STORE_FAST = b"}"
 
 
+# Bit n is set if opcode n is a jump whose operand is an absolute offset
+JUMP_OPERATIONS_MASK = sum(
+    1 << operation[0]
+    for operation in (
+        OpCode.JUMP_ABSOLUTE,
+        OpCode.JUMP_IF_FALSE_OR_POP,
+        OpCode.JUMP_IF_TRUE_OR_POP,
+        OpCode.POP_JUMP_IF_FALSE,
+        OpCode.POP_JUMP_IF_TRUE,
+    )
+)
+
+
 def ensure_python_version(function):
     """Raise SystemError if Python version not in 3.{5, 6, 7}"""
 
@@ -43,7 +57,7 @@ def remove_duplicates(tuple_: Tuple[Any, ...]) -> Tuple[Any, ...]:
              The returned tuple is: (3, 1, 2, 4)
     """
 
-    return tuple(sorted(set(tuple_), key=tuple_.index))
+    return tuple(OrderedDict.fromkeys(tuple_))
 
 
 @ensure_python_version
@@ -106,6 +120,45 @@ def python_ints2int(items: List[int]) -> int:
         return items[0]
 
 
+@lru_cache(maxsize=1024)
+def _get_disassembled_offsets(code: CodeType) -> Tuple[int, ...]:
+    """Return the offset of each instruction of `code`, as found by `dis`.
+
+    Disassembling is expensive and code objects are immutable, so the result is cached
+    per code object.
+    """
+    return tuple(instr.offset for instr in dis.Bytecode(code))
+
+
+@ensure_python_version
+def get_instructions_offsets(code: CodeType) -> Tuple[int, ...]:
+    """Return the offset of each instruction of `code`, followed by the length of its
+    bytecode.
+
+    Exemple:
+    def function(x, y):
+        print(x, y)
+
+    With Python 3.5:
+    get_instructions_offsets(function.__code__) = (0, 3, 6, 9, 12, 13, 16, 17)
+
+    With Python 3.{6, 7}:
+    get_instructions_offsets(function.__code__) = (0, 2, 4, 6, 8, 10, 12, 14)
+
+    With Python 3.{6, 7}, every instruction is 2 bytes long so offsets are computed
+    directly. With Python 3.5, instructions have a variable length and `code` has to be
+    disassembled.
+
+    If Python version not in 3.{5, 6, 7}, a SystemError is raised.
+    """
+    len_bytecode = len(code.co_code)
+
+    if sys.version_info.minor != 5:
+        return tuple(range(0, len_bytecode + 1, 2))
+
+    return _get_disassembled_offsets(code) + (len_bytecode,)
+
+
 @ensure_python_version
 def get_instructions(func: FunctionType) -> Iterable[bytes]:
     """Return a list of bytes where each item of a list correspond to an instruction.
@@ -154,11 +207,11 @@ def get_instructions(func: FunctionType) -> Iterable[bytes]:
         return zip(a, b)
 
     func_co_code = func.__code__.co_code
-    len_bytecode = len(func_co_code)
 
-    instructions_offsets = tuple(instr.offset for instr in dis.Bytecode(func)) + (
-        len_bytecode,
-    )
+    if sys.version_info.minor != 5:
+        return (func_co_code[i : i + 2] for i in range(0, len(func_co_code), 2))
+
+    instructions_offsets = get_instructions_offsets(func.__code__)
 
     return (func_co_code[start:stop] for start, stop in pairwise(instructions_offsets))
 
@@ -175,17 +228,19 @@ def has_no_return(func: FunctionType) -> bool:
     co_code = code.co_code
     co_consts = code.co_consts
 
-    instructions = tuple(get_instructions(func))
+    load_const_none = OpCode.LOAD_CONST + bytes((co_consts.index(None),))
 
-    return_offsets = tuple(
-        index
-        for index, instruction in enumerate(instructions)
-        if instruction[0] == int.from_bytes(OpCode.RETURN_VALUE, byteorder="little")
-    )
+    if sys.version_info.minor != 5:
+        # Operations are at even offsets, operands at odd ones
+        nb_returns = co_code[::2].count(OpCode.RETURN_VALUE)
+        return nb_returns == 1 and co_code[-4:-2] == load_const_none
 
-    load_const_none = OpCode.LOAD_CONST + bytes((co_consts.index(None),))
+    instructions = tuple(get_instructions(func))
 
-    return len(return_offsets) == 1 and instructions[-2][0:2] == load_const_none
+    return_value = OpCode.RETURN_VALUE[0]
+    nb_returns = sum(instruction[0] == return_value for instruction in instructions)
+
+    return nb_returns == 1 and instructions[-2][0:2] == load_const_none
 
 
 def has_duplicates(tuple_: Tuple):
@@ -215,26 +270,112 @@ def get_transitions(olds: Tuple, news: Tuple) -> Dict[int, int]:
 
     `olds` and `news` should not have any duplicates, else a ValueError is raised.
     """
-    if has_duplicates(olds):
+    olds_indexes = {old: index for index, old in enumerate(olds)}
+    news_indexes = {new: index for index, new in enumerate(news)}
+
+    if len(olds_indexes) != len(olds):
         raise ValueError("`olds` has duplicates")
 
-    if has_duplicates(news):
+    if len(news_indexes) != len(news):
         raise ValueError("`news` has duplicates")
 
     return {
-        index_old: news.index(old)
-        for index_old, old in [(olds.index(old), old) for old in olds if old in news]
+        index_old: news_indexes[old]
+        for old, index_old in olds_indexes.items()
+        if old in news_indexes
     }
 
 
+@ensure_python_version
+def fill_b_transitions(
+    b_transitions: Dict[bytes, bytes],
+    transitions: Dict[int, int],
+    byte_source: bytes,
+    byte_dest: bytes,
+):
+    """Add to `b_transitions` the instruction `byte_source` applied to each key of
+    `transitions`, mapped to the instruction `byte_dest` applied to the corresponding
+    value.
+
+    Transitions which would replace an instruction by itself are left out.
+
+    If Python version not in 3.{5, 6, 7}, a SystemError is raised.
+    """
+    for key, value in transitions.items():
+        if byte_source != byte_dest or key != value:
+            b_transitions[byte_source + int2python_bytes(key)] = (
+                byte_dest + int2python_bytes(value)
+            )
+
+
 @ensure_python_version
 def get_b_transitions(
     transitions: Dict[int, int], byte_source: bytes, byte_dest: bytes
 ) -> Dict[bytes, bytes]:
-    return {
-        byte_source + int2python_bytes(key): byte_dest + int2python_bytes(value)
-        for key, value in transitions.items()
-    }
+    """Return a dictionnary where a key is the instruction `byte_source` applied to a
+    key of `transitions` and the value is the instruction `byte_dest` applied to the
+    corresponding value.
+
+    Transitions which would replace an instruction by itself are left out, so the
+    returned dictionnary is empty when there is nothing to replace.
+
+    If Python version not in 3.{5, 6, 7}, a SystemError is raised.
+    """
+    b_transitions = {}
+    fill_b_transitions(b_transitions, transitions, byte_source, byte_dest)
+    return b_transitions
+
+
+@ensure_python_version
+def get_code_b_transitions(
+    trans_co_consts: Dict[int, int],
+    trans_co_names: Dict[int, int],
+    trans_co_varnames: Dict[int, int],
+) -> Dict[bytes, bytes]:
+    """Return the instructions transitions corresponding to `co_consts`, `co_names`
+    and `co_varnames` transitions, all written in a single dictionnary.
+
+    If Python version not in 3.{5, 6, 7}, a SystemError is raised.
+    """
+    b_transitions = {}
+
+    for transitions, operations in (
+        (trans_co_consts, (OpCode.LOAD_CONST,)),
+        (
+            trans_co_names,
+            (
+                OpCode.LOAD_GLOBAL,
+                OpCode.LOAD_METHOD,
+                OpCode.LOAD_ATTR,
+                OpCode.STORE_ATTR,
+            ),
+        ),
+        (trans_co_varnames, (OpCode.LOAD_FAST, OpCode.STORE_FAST)),
+    ):
+        for operation in operations:
+            fill_b_transitions(b_transitions, transitions, operation, operation)
+
+    return b_transitions
+
+
+def replace_instructions(
+    instructions: Iterable[bytes], transitions: Dict[bytes, bytes]
+) -> bytes:
+    """Return the bytecode made of `instructions` where each instruction which is a
+    key of `transitions` is replaced by the corresponding value.
+
+    Exemple:
+    instructions = (b"|\x00", b"|\x01", b"d\x00", b"S\x00")
+    transitions = {b"|\x01": b"d\x02"}
+
+    replace_instructions(instructions, transitions) = b"|\x00d\x02d\x00S\x00"
+    """
+    if not transitions:
+        return b"".join(instructions)
+
+    return b"".join(
+        transitions.get(instruction, instruction) for instruction in instructions
+    )
 
 
 @ensure_python_version
@@ -245,35 +386,31 @@ def are_functions_equivalent(l_func, r_func):
     """
     l_code, r_code = l_func.__code__, r_func.__code__
 
+    # Cheap checks first, so most non equivalent functions are rejected without
+    # rewriting any bytecode
+    if not (
+        len(l_code.co_code) == len(r_code.co_code)
+        and set(l_code.co_consts) == set(r_code.co_consts)
+        and set(l_code.co_names) == set(r_code.co_names)
+        and set(l_code.co_varnames) == set(r_code.co_varnames)
+    ):
+        return False
+
     trans_co_consts = get_transitions(l_code.co_consts, r_code.co_consts)
     trans_co_names = get_transitions(l_code.co_names, r_code.co_names)
     trans_co_varnames = get_transitions(l_code.co_varnames, r_code.co_varnames)
 
-    transitions = {
-        **get_b_transitions(trans_co_consts, OpCode.LOAD_CONST, OpCode.LOAD_CONST),
-        **get_b_transitions(trans_co_names, OpCode.LOAD_GLOBAL, OpCode.LOAD_GLOBAL),
-        **get_b_transitions(trans_co_names, OpCode.LOAD_METHOD, OpCode.LOAD_METHOD),
-        **get_b_transitions(trans_co_names, OpCode.LOAD_ATTR, OpCode.LOAD_ATTR),
-        **get_b_transitions(trans_co_names, OpCode.STORE_ATTR, OpCode.STORE_ATTR),
-        **get_b_transitions(trans_co_varnames, OpCode.LOAD_FAST, OpCode.LOAD_FAST),
-        **get_b_transitions(trans_co_varnames, OpCode.STORE_FAST, OpCode.STORE_FAST),
-    }
-
-    l_instructions = get_instructions(l_func)
-    r_instructions = get_instructions(r_func)
-
-    new_l_instructions = tuple(
-        transitions.get(instruction, instruction) for instruction in l_instructions
+    transitions = get_code_b_transitions(
+        trans_co_consts, trans_co_names, trans_co_varnames
     )
 
-    new_l_co_code = b"".join(new_l_instructions)
-
-    co_code_cond = new_l_co_code == r_code.co_code
-    co_consts_cond = set(l_code.co_consts) == set(r_code.co_consts)
-    co_names_cond = set(l_code.co_names) == set(l_code.co_names)
-    co_varnames_cond = set(l_code.co_varnames) == set(l_code.co_varnames)
+    new_l_co_code = (
+        replace_instructions(get_instructions(l_func), transitions)
+        if transitions
+        else l_code.co_code
+    )
 
-    return co_code_cond and co_consts_cond and co_names_cond and co_varnames_cond
+    return new_l_co_code == r_code.co_code
 
 
 @ensure_python_version
@@ -302,19 +439,38 @@ def shift_instructions(instructions: Tuple[bytes], qty: int) -> Tuple[bytes]:
     """
     return tuple(
         shift_instruction(instruction, qty)
-        if bytes((instruction[0],))
-        in (
-            OpCode.JUMP_ABSOLUTE,
-            OpCode.JUMP_IF_FALSE_OR_POP,
-            OpCode.JUMP_IF_TRUE_OR_POP,
-            OpCode.POP_JUMP_IF_FALSE,
-            OpCode.POP_JUMP_IF_TRUE,
-        )
+        if (JUMP_OPERATIONS_MASK >> instruction[0]) & 1
         else instruction
         for instruction in instructions
     )
 
 
+@ensure_python_version
+def get_shifted_bytecode(func: FunctionType, qty: int) -> bytes:
+    """Return the bytecode of `func` where JUMP_ABSOLUTE, JUMP_IF_FALSE_OR_POP,
+    JUMP_IF_TRUE_OR_POP, POP_JUMP_IF_FALSE & POP_JUMP_IF_TRUE instructions are shifted
+    by qty.
+
+    The result is the same as `b"".join(shift_instructions(get_instructions(func)))`,
+    but jump operands are patched in place in a copy of the bytecode instead of
+    rebuilding every instruction.
+
+    If Python version not in 3.{5, 6, 7}, a SystemError is raised.
+    """
+    code = func.__code__
+    nb_bytes = 2 if sys.version_info.minor == 5 else 1
+
+    bytecode = bytearray(code.co_code)
+
+    for offset in get_instructions_offsets(code)[:-1]:
+        if (JUMP_OPERATIONS_MASK >> bytecode[offset]) & 1:
+            start, stop = offset + 1, offset + 1 + nb_bytes
+            value = python_ints2int(bytecode[start:stop]) + qty
+            bytecode[start:stop] = int2python_bytes(value)
+
+    return bytes(bytecode)
+
+
 @ensure_python_version
 def pin_arguments(func: FunctionType, arguments: dict):
     """Transform `func` in a function with no arguments.
@@ -352,27 +508,33 @@ def pin_arguments(func: FunctionType, arguments: dict):
     new_co_consts = remove_duplicates(func_co_consts + tuple(arguments.values()))
     new_co_varnames = tuple(item for item in func_co_varnames if item not in arguments)
 
+    varnames_indexes = {item: index for index, item in enumerate(func_co_varnames)}
+    consts_indexes = {item: index for index, item in enumerate(new_co_consts)}
+
     trans_co_varnames2_co_consts = {
-        func_co_varnames.index(key): new_co_consts.index(value)
+        varnames_indexes[key]: consts_indexes[value]
         for key, value in arguments.items()
     }
 
     trans_co_varnames = get_transitions(func_co_varnames, new_co_varnames)
 
-    transitions = {
-        **get_b_transitions(
-            trans_co_varnames2_co_consts, OpCode.LOAD_FAST, OpCode.LOAD_CONST
-        ),
-        **get_b_transitions(trans_co_varnames, OpCode.LOAD_FAST, OpCode.LOAD_FAST),
-        **get_b_transitions(trans_co_varnames, OpCode.STORE_FAST, OpCode.STORE_FAST),
-    }
+    transitions = {}
 
-    func_instructions = get_instructions(func)
-    new_func_instructions = tuple(
-        transitions.get(instruction, instruction) for instruction in func_instructions
+    fill_b_transitions(
+        transitions, trans_co_varnames2_co_consts, OpCode.LOAD_FAST, OpCode.LOAD_CONST
+    )
+    fill_b_transitions(
+        transitions, trans_co_varnames, OpCode.LOAD_FAST, OpCode.LOAD_FAST
+    )
+    fill_b_transitions(
+        transitions, trans_co_varnames, OpCode.STORE_FAST, OpCode.STORE_FAST
     )
 
-    new_co_code = b"".join(new_func_instructions)
+    new_co_code = (
+        replace_instructions(get_instructions(func), transitions)
+        if transitions
+        else func_code.co_code
+    )
 
     new_func = FunctionType(
         func.__code__,
@@ -454,14 +616,18 @@ def inline(pre_func: FunctionType, func: FunctionType, pre_func_arguments: dict)
     pinned_pre_func_instructions = tuple(get_instructions(pinned_pre_func))
     pinned_pre_func_instructions_without_return = pinned_pre_func_instructions[:-2]
 
+    # Offset of the final `LOAD_CONST None`, i.e. the length of the bytecode kept
+    len_pinned_pre_func_without_return = get_instructions_offsets(
+        pinned_pre_func_code
+    )[-3]
+
     func_code = func.__code__
     func_co_consts = func_code.co_consts
     func_co_names = func_code.co_names
     func_co_varnames = func_code.co_varnames
 
-    func_instructions = tuple(get_instructions(func))
-    shifted_func_instructions = shift_instructions(
-        func_instructions, len(b"".join(pinned_pre_func_instructions_without_return))
+    shifted_func_co_code = get_shifted_bytecode(
+        func, len_pinned_pre_func_without_return
     )
 
     new_co_consts = remove_duplicates(func_co_consts + pinned_pre_func_co_consts)
@@ -472,23 +638,13 @@ def inline(pre_func: FunctionType, func: FunctionType, pre_func_arguments: dict)
     trans_co_names = get_transitions(pinned_pre_func_co_names, new_co_names)
     trans_co_varnames = get_transitions(pinned_pre_func_co_varnames, new_co_varnames)
 
-    transitions = {
-        **get_b_transitions(trans_co_consts, OpCode.LOAD_CONST, OpCode.LOAD_CONST),
-        **get_b_transitions(trans_co_names, OpCode.LOAD_GLOBAL, OpCode.LOAD_GLOBAL),
-        **get_b_transitions(trans_co_names, OpCode.LOAD_METHOD, OpCode.LOAD_METHOD),
-        **get_b_transitions(trans_co_names, OpCode.LOAD_ATTR, OpCode.LOAD_ATTR),
-        **get_b_transitions(trans_co_names, OpCode.STORE_ATTR, OpCode.STORE_ATTR),
-        **get_b_transitions(trans_co_varnames, OpCode.LOAD_FAST, OpCode.LOAD_FAST),
-        **get_b_transitions(trans_co_varnames, OpCode.STORE_FAST, OpCode.STORE_FAST),
-    }
-
-    new_pinned_pre_func_instructions = tuple(
-        transitions.get(instruction, instruction)
-        for instruction in pinned_pre_func_instructions_without_return
+    transitions = get_code_b_transitions(
+        trans_co_consts, trans_co_names, trans_co_varnames
     )
 
-    new_instructions = new_pinned_pre_func_instructions + shifted_func_instructions
-    new_co_code = b"".join(new_instructions)
+    new_co_code = replace_instructions(
+        pinned_pre_func_instructions_without_return, transitions
+    ) + shifted_func_co_code
 
     nfcode = new_func.__code__
 
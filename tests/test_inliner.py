@@ -71,6 +71,24 @@ def test_python_ints2int():
         assert inliner.python_ints2int([5]) == 5
 
 
+def test_get_instructions_offsets():
+    def function(x, y):
+        print(x, y)
+
+    python_version = sys.version_info
+    if not (python_version.major == 3 and python_version.minor in (5, 6, 7)):
+        with pytest.raises(SystemError):
+            inliner.get_instructions_offsets(function.__code__)
+        return
+
+    if python_version.minor == 5:
+        expected = (0, 3, 6, 9, 12, 13, 16, 17)
+    else:
+        expected = (0, 2, 4, 6, 8, 10, 12, 14)
+
+    assert inliner.get_instructions_offsets(function.__code__) == expected
+
+
 def test_get_instructions():
     def function(x, y):
         print(x, y)
@@ -129,6 +147,12 @@ def test_has_no_return():
     assert not inliner.has_no_return(func_return_something)
     assert not inliner.has_no_return(func_several_returns)
 
+    # 83 is the RETURN_VALUE opcode, here used as an operand
+    namespace = {}
+    items = ", ".join('"{}"'.format(index) for index in range(90))
+    exec("def func_operand_83():\n    print([{}])".format(items), namespace)
+    assert inliner.has_no_return(namespace["func_operand_83"])
+
 
 def test_has_duplicates():
     assert not inliner.has_duplicates([1, 3, 2, 4])
@@ -177,6 +201,42 @@ def test_get_b_transitions():
 
     assert bytes_transitions == expected
 
+    assert inliner.get_b_transitions({1: 1}, byte_source, byte_source) == {}
+    assert len(inliner.get_b_transitions({1: 1}, byte_source, byte_dest)) == 1
+
+
+def test_get_code_b_transitions():
+    python_version = sys.version_info
+    if not (python_version.major == 3 and python_version.minor in (5, 6, 7)):
+        with pytest.raises(SystemError):
+            inliner.get_code_b_transitions({}, {}, {})
+        return
+
+    OpCode = inliner.OpCode
+    to_bytes = inliner.int2python_bytes
+
+    expected = {
+        OpCode.LOAD_CONST + to_bytes(0): OpCode.LOAD_CONST + to_bytes(2),
+        OpCode.LOAD_GLOBAL + to_bytes(1): OpCode.LOAD_GLOBAL + to_bytes(0),
+        OpCode.LOAD_METHOD + to_bytes(1): OpCode.LOAD_METHOD + to_bytes(0),
+        OpCode.LOAD_ATTR + to_bytes(1): OpCode.LOAD_ATTR + to_bytes(0),
+        OpCode.STORE_ATTR + to_bytes(1): OpCode.STORE_ATTR + to_bytes(0),
+        OpCode.LOAD_FAST + to_bytes(3): OpCode.LOAD_FAST + to_bytes(4),
+        OpCode.STORE_FAST + to_bytes(3): OpCode.STORE_FAST + to_bytes(4),
+    }
+
+    assert inliner.get_code_b_transitions({0: 2, 1: 1}, {1: 0}, {3: 4}) == expected
+
+
+def test_replace_instructions():
+    instructions = (b"|\x00", b"|\x01", b"}\x00", b"d\x00", b"S\x00")
+    transitions = {b"|\x01": b"d\x02", b"}\x00": b"}\x01"}
+
+    expected = b"|\x00d\x02}\x01d\x00S\x00"
+
+    assert inliner.replace_instructions(instructions, transitions) == expected
+    assert inliner.replace_instructions(instructions, {}) == b"".join(instructions)
+
 
 def test_are_functions_equivalent():
     def a_func(x, y):
@@ -189,8 +249,20 @@ def test_are_functions_equivalent():
         print(c + str(x + y))
         return x * math.sin(y)
 
+    def other_names_func(x, y):
+        c = 3
+        print(c + str(x + y))
+        return x * math.cos(y)
+
+    def other_varnames_func(x, z):
+        c = 3
+        print(c + str(x + z))
+        return x * math.sin(z)
+
     assert inliner.are_functions_equivalent(a_func, a_func)
     assert not inliner.are_functions_equivalent(a_func, another_func)
+    assert not inliner.are_functions_equivalent(a_func, other_names_func)
+    assert not inliner.are_functions_equivalent(a_func, other_varnames_func)
 
 
 def test_shift_instruction():
@@ -371,6 +443,27 @@ def test_shift_instructions():
     assert inliner.shift_instructions(instructions, 3) == expected_shifted_instructions
 
 
+def test_get_shifted_bytecode():
+    def func(a, b):
+        if a > b or a == 2:
+            for i in range(a):
+                print(i)
+
+        return a and b
+
+    python_version = sys.version_info
+    if not (python_version.major == 3 and python_version.minor in (5, 6, 7)):
+        with pytest.raises(SystemError):
+            inliner.get_shifted_bytecode(func, 3)
+        return
+
+    instructions = tuple(inliner.get_instructions(func))
+    expected = b"".join(inliner.shift_instructions(instructions, 3))
+
+    assert inliner.get_shifted_bytecode(func, 3) == expected
+    assert inliner.get_shifted_bytecode(func, 3) != func.__code__.co_code
+
+
 def test_pin_arguments():
     python_version = sys.version_info
     if not (python_version.major == 3 and python_version.minor in (5, 6, 7)):